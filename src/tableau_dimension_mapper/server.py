@@ -1,12 +1,18 @@
+import io
 import os
-import json
+import re
 import csv
+import json
 import tempfile
+import shutil
 import logging
+import mmap
+import asyncio
+import threading
+from collections import defaultdict
 from typing import Any, Sequence, Dict, List
 from datetime import datetime
-from bs4 import BeautifulSoup
-import pandas as pd
+import xml.etree.ElementTree as ET
 
 from dotenv import load_dotenv
 from mcp.server import Server
@@ -22,204 +28,461 @@ load_dotenv()
 # Create server instance
 app = Server("tableau-dimension-mapper")
 
-# List of tools and their descriptions for LLM
-@app.list_tools()
-async def list_tools() -> list[Tool]:
-    """List available Tableau dimension mapping tools."""
-    return [
-        Tool(
-            name="remap_dimensions",
-            description="""Remaps dimensions in a Tableau workbook based on a CSV mapping file.
-            This tool reads both the mapping file and Tableau workbook, applies the mapping rules, and creates a new workbook file.
-            For each mapping rule, it replaces all occurrences of the original name with the new name throughout the workbook.
-            It returns a report of how many replacements were made and a path to the new workbook file.
-            """,
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "mapping_file_path": {
-                        "type": "string",
-                        "description": "Path to the CSV mapping file containing the dimension mappings"
-                    },
-                    "workbook_file_path": {
-                        "type": "string",
-                        "description": "Path to the Tableau workbook file (.twb) to modify"
-                    },
-                    "output_file_path": {
-                        "type": "string",
-                        "description": "Path where the modified workbook file should be saved"
-                    }
-                },
-                "required": ["mapping_file_path", "workbook_file_path", "output_file_path"]
-            }
-        ),
-        Tool(
-            name="extract_toml_mappings",
-            description="""Analyzes a TOML configuration file to extract dimension mappings and create a CSV file.
-            
-            Look for a section in the TOML that contains field/dimension mappings, such as [columns.other_renames].
-            For each mapping found, extract the original name (key) and the new name (value).
-            
-            Create a CSV string where each line is in the format: original_name,new_name
-            For example, if you find:
-            dimension_1 = "Distribution/Program"
-            
-            The CSV line should be:
-            dimension_1,Distribution/Program
-            
-            Do not include any headers in the CSV.
-            Strip any unnecessary quotes from the values.
-            Ensure there is no trailing comma or whitespace.
-            """,
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "toml_file_path": {
-                        "type": "string",
-                        "description": "Path to the TOML configuration file to analyze"
-                    },
-                    "output_csv_path": {
-                        "type": "string",
-                        "description": "Path where the CSV mapping file should be saved"
-                    }
-                },
-                "required": ["toml_file_path", "output_csv_path"]
-            }
-        ),
-        Tool(
-            name="validate_mapping_file",
-            description="""Validates a CSV mapping file to ensure it has the correct format.
-            The CSV should have two columns: the first column is the original field name, the second column is the new field name.
-            This tool will check if the file is properly formatted and return a list of the mappings it contains.
-            
-            Example of a valid mapping CSV:
-            First name, name First
-            Last name, name Last
-            """,
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "mapping_file_path": {
-                        "type": "string",
-                        "description": "Path to the CSV mapping file to validate"
-                    }
-                },
-                "required": ["mapping_file_path"]
-            }
-        ),
-        Tool(
-            name="validate_tableau_workbook",
-            description="""Validates a Tableau workbook file (.twb) to ensure it can be processed.
-            This tool checks if the file is a valid XML file with the expected Tableau workbook structure.
-            It returns information about the workbook such as version, number of datasources, and worksheets.
-            """,
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "workbook_file_path": {
-                        "type": "string",
-                        "description": "Path to the Tableau workbook file (.twb) to validate"
-                    }
-                },
-                "required": ["workbook_file_path"]
-            }
-        ),
-        Tool(
-            name="analyze_workbook",
-            description="""Analyzes a Tableau workbook to identify dimensions and fields that could be remapped.
-            This tool parses the workbook XML structure and extracts field names, dimension references, and other metadata.
-            It provides a report of the fields found, their usage patterns, and potential candidates for remapping.
-            Use this tool to understand the structure of a workbook before creating mapping suggestions.
-            """,
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "workbook_file_path": {
-                        "type": "string",
-                        "description": "Path to the Tableau workbook file (.twb) to analyze"
-                    }
+def _load_mappings(mapping_file_path: str, strict: bool = False) -> List[tuple]:
+    """Load (original name, new name) pairs from a two-column CSV mapping file.
+    
+    Blank lines are skipped and fields past the second are ignored. Rows with fewer than
+    two columns or an empty original name raise a ValueError when strict is set and are
+    skipped otherwise; an empty new name is kept.
+    """
+    with open(mapping_file_path, 'rb') as f:
+        text = f.read().decode('utf-8-sig')
+    
+    if '"' in text:
+        # Quoted fields need a real CSV parser
+        reader = csv.reader(io.StringIO(text, newline=''))
+        rows = ((reader.line_num, row) for row in reader)
+    else:
+        # Without quotes every comma is a delimiter, so plain splitting is enough
+        rows = ((i + 1, line.split(',', 2)) for i, line in enumerate(text.splitlines()))
+    
+    mappings = []
+    for line_num, fields in rows:
+        if not fields or (len(fields) == 1 and not fields[0].strip()):
+            continue
+        if len(fields) < 2:
+            if strict:
+                raise ValueError(f"Line {line_num} does not have at least two columns")
+            continue
+        old = fields[0].strip()
+        if not old:
+            if strict:
+                raise ValueError(f"Line {line_num} has an empty original name")
+            continue
+        # An empty new name is a valid rule that deletes the original name
+        mappings.append((old, fields[1].strip()))
+    return mappings
+
+# Parsed workbook summaries keyed by (path, mtime, size), most recently used last
+_WORKBOOK_CACHE: Dict[tuple, dict] = {}
+_WORKBOOK_CACHE_SIZE = 4
+_WORKBOOK_CACHE_LOCK = threading.Lock()
+
+# Workbooks at least this large are parsed with lxml; smaller ones use the stdlib parser
+_LXML_MIN_SIZE = 8 << 20
+
+def _iterparse_workbook(workbook_file_path: str, size: int):
+    """Return a start/end iterparse over the workbook, avoiding the lxml import for small files."""
+    if size < _LXML_MIN_SIZE:
+        return ET.iterparse(workbook_file_path, events=('start', 'end'))
+    
+    from lxml import etree
+    # huge_tree lifts libxml2's limit on very large text nodes found in big workbooks
+    return etree.iterparse(workbook_file_path, events=('start', 'end'), huge_tree=True)
+
+def _parse_workbook(workbook_file_path: str, size: int) -> dict:
+    """Extract the workbook version, datasource count, worksheets, columns and calculations in one streaming pass."""
+    is_workbook = False
+    version = 'unknown'
+    datasources = 0
+    worksheet_count = 0
+    worksheets = []
+    columns = set()
+    calculations = []
+    open_elements = []
+    for event, elem in _iterparse_workbook(workbook_file_path, size):
+        if event == 'end':
+            open_elements.pop()
+            elem.clear()
+            # Detach finished siblings too, otherwise their empty shells pile up under the root
+            if open_elements:
+                del open_elements[-1][:-1]
+            continue
+        open_elements.append(elem)
+        tag = elem.tag
+        if tag == 'column':
+            name = elem.get('name')
+            if name:
+                columns.add(name)
+        elif tag == 'calculation':
+            formula = elem.get('formula')
+            if formula:
+                calculations.append(formula)
+        elif tag == 'datasource':
+            datasources += 1
+        elif tag == 'worksheet':
+            worksheet_count += 1
+            name = elem.get('name')
+            if name:
+                worksheets.append(name)
+        elif tag == 'workbook' and not is_workbook:
+            is_workbook = True
+            version = elem.get('version', 'unknown')
+    
+    return {
+        'is_workbook': is_workbook,
+        'version': version,
+        'datasources': datasources,
+        'worksheet_count': worksheet_count,
+        'worksheets': tuple(worksheets),
+        'columns': tuple(sorted(columns)),
+        'calculations': tuple(calculations),
+    }
+
+def _load_workbook(workbook_file_path: str) -> dict:
+    """Return the parsed workbook summary, reusing it while the file is unchanged."""
+    stat = os.stat(workbook_file_path)
+    key = (os.path.abspath(workbook_file_path), stat.st_mtime_ns, stat.st_size)
+    
+    with _WORKBOOK_CACHE_LOCK:
+        workbook = _WORKBOOK_CACHE.pop(key, None)
+        if workbook is not None:
+            _WORKBOOK_CACHE[key] = workbook
+            return workbook
+    
+    # Parse outside the lock so tool calls on different workbooks run concurrently
+    workbook = _parse_workbook(workbook_file_path, stat.st_size)
+    with _WORKBOOK_CACHE_LOCK:
+        _WORKBOOK_CACHE.pop(key, None)
+        if len(_WORKBOOK_CACHE) >= _WORKBOOK_CACHE_SIZE:
+            del _WORKBOOK_CACHE[next(iter(_WORKBOOK_CACHE))]
+        _WORKBOOK_CACHE[key] = workbook
+    return workbook
+
+# Output directories already created by this process
+_ENSURED_DIRS: set[str] = set()
+
+def _ensure_dir(file_path: str) -> None:
+    """Create the parent directory of file_path once per process; no-op for bare file names."""
+    directory = os.path.dirname(file_path)
+    if directory and directory not in _ENSURED_DIRS:
+        os.makedirs(directory, exist_ok=True)
+        _ENSURED_DIRS.add(directory)
+
+# Read size used when streaming a workbook through the replacement pass
+_CHUNK_SIZE = 1 << 20
+
+# Rule sets up to this size use a compiled regex; larger ones use an Aho-Corasick automaton,
+# which stays flat as rules are added while the regex slows down with every alternative
+_REGEX_MAX_RULES = 10
+
+def _build_regex_matcher(mappings: List[tuple]):
+    """Build a matcher from a single compiled bytes alternation over all original names."""
+    rules = {}
+    for old, new in mappings:
+        # The first rule for a repeated original name wins
+        rules.setdefault(old.encode('utf-8'), (old, new.encode('utf-8')))
+    # Longest alternatives first so the longest name wins at each position
+    pattern = re.compile(b'|'.join(map(re.escape, sorted(rules, key=len, reverse=True))))
+    
+    def find_matches(buf: bytes, limit: int):
+        for match in pattern.finditer(buf):
+            start = match.start()
+            if start >= limit:
+                break
+            old, new = rules[match.group()]
+            yield start, match.end(), old, new
+    
+    return find_matches
+
+def _build_automaton_matcher(mappings: List[tuple]):
+    """Build a matcher from a pyahocorasick automaton over all original names.
+    
+    The published pyahocorasick wheels only accept str, so the automaton is keyed on
+    latin-1 views of the UTF-8 encoded names, where one character maps to one byte.
+    """
+    import ahocorasick
+    
+    automaton = ahocorasick.Automaton()
+    for old, new in mappings:
+        key = old.encode('utf-8').decode('latin-1')
+        # The first rule for a repeated original name wins
+        if key not in automaton:
+            automaton.add_word(key, (old, len(key), new.encode('utf-8')))
+    automaton.make_automaton()
+    
+    def find_matches(buf: bytes, limit: int):
+        # Keep the longest match at each start offset, then take them left to right
+        longest = {}
+        for end, value in automaton.iter(buf.decode('latin-1')):
+            start = end - value[1] + 1
+            if start < limit and (start not in longest or value[1] > longest[start][1]):
+                longest[start] = value
+        
+        pos = 0
+        for start in sorted(longest):
+            if start < pos:
+                continue
+            old, key_len, new = longest[start]
+            pos = start + key_len
+            yield start, pos, old, new
+    
+    return find_matches
+
+def _stream_replace(fin, fout, find_matches, max_len: int) -> Dict[str, int]:
+    """Copy fin to fout in binary chunks, replacing every match reported by find_matches.
+    
+    fin is anything with a binary read(size), such as an open file or an mmap.
+    find_matches(buf, limit) yields non-overlapping (start, end, old, new) byte matches
+    starting before limit, left to right. The last max_len - 1 bytes of each chunk
+    are carried over so matches spanning a chunk boundary are still found.
+    Returns the number of replacements made per original name.
+    """
+    counts = {}
+    tail = b''
+    while True:
+        chunk = fin.read(_CHUNK_SIZE)
+        final = not chunk
+        buf = tail + chunk
+        # Only the combined buffer is needed from here on
+        del chunk, tail
+        
+        # Matches starting before this offset cannot be extended by later data
+        safe = len(buf) if final else len(buf) - max_len + 1
+        
+        pieces = []
+        pos = 0
+        for start, end, old, new in find_matches(buf, safe):
+            pieces.append(buf[pos:start])
+            pieces.append(new)
+            counts[old] = counts.get(old, 0) + 1
+            pos = end
+        
+        if final:
+            pieces.append(buf[pos:])
+            fout.write(b''.join(pieces))
+            return counts
+        
+        keep = max(pos, safe)
+        pieces.append(buf[pos:keep])
+        fout.write(b''.join(pieces))
+        tail = buf[keep:]
+
+def _replace_mapped(mm: mmap.mmap, fout, find_matches) -> Dict[str, int]:
+    """Replace every match in a memory-mapped workbook, writing the output as it goes.
+    
+    Unchanged spans are written straight from the mapping through a memoryview, so the
+    input is never copied onto the heap; untouched pages are only read by the scan itself.
+    Returns the number of replacements made per original name.
+    """
+    counts = {}
+    pos = 0
+    with memoryview(mm) as view:
+        for start, end, old, new in find_matches(mm, len(mm)):
+            fout.write(view[pos:start])
+            fout.write(new)
+            counts[old] = counts.get(old, 0) + 1
+            pos = end
+        fout.write(view[pos:])
+    return counts
+
+def _stream_split_replace(fin, fout, old: str, new: str) -> Dict[str, int]:
+    """Copy fin to fout in chunks, replacing a single name with bytes.split and join.
+    
+    Splitting finds and counts every occurrence in the same pass that produces the
+    pieces to join. Only the last len(old) - 1 bytes of the trailing piece can start
+    a match that continues into the next chunk, so just those are carried over.
+    """
+    old_bytes = old.encode('utf-8')
+    new_bytes = new.encode('utf-8')
+    count = 0
+    tail = b''
+    while True:
+        chunk = fin.read(_CHUNK_SIZE)
+        final = not chunk
+        parts = (tail + chunk).split(old_bytes)
+        # The split pieces hold all the data; drop the raw chunk before writing
+        del chunk
+        count += len(parts) - 1
+        tail = parts.pop()
+        
+        if final:
+            parts.append(tail)
+            fout.write(new_bytes.join(parts))
+            return {old: count} if count else {}
+        
+        keep = max(len(tail) - len(old_bytes) + 1, 0)
+        parts.append(tail[:keep])
+        fout.write(new_bytes.join(parts))
+        tail = tail[keep:]
+
+# List of tools and their descriptions for LLM, built once at import
+_TOOLS: list[Tool] = [
+    Tool(
+        name="remap_dimensions",
+        description="""Remaps dimensions in a Tableau workbook based on a CSV mapping file.
+        This tool reads both the mapping file and Tableau workbook, applies the mapping rules, and creates a new workbook file.
+        For each mapping rule, it replaces all occurrences of the original name with the new name throughout the workbook.
+        It returns a report of how many replacements were made and a path to the new workbook file.
+        """,
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "mapping_file_path": {
+                    "type": "string",
+                    "description": "Path to the CSV mapping file containing the dimension mappings"
                 },
-                "required": ["workbook_file_path"]
-            }
-        ),
-        Tool(
-            name="write_file",
-            description="""Writes content to a file at the specified path.
-            This tool is useful for creating CSV mapping files based on your analysis of a Tableau workbook.
-            You can use this after analyzing a workbook to create a mapping file with suggested dimension name improvements.
-            """,
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "file_path": {
-                        "type": "string",
-                        "description": "Path where the file should be written"
-                    },
-                    "content": {
-                        "type": "string",
-                        "description": "Content to write to the file"
-                    }
+                "workbook_file_path": {
+                    "type": "string",
+                    "description": "Path to the Tableau workbook file (.twb) to modify"
                 },
-                "required": ["file_path", "content"]
-            }
-        )
-    ]
+                "output_file_path": {
+                    "type": "string",
+                    "description": "Path where the modified workbook file should be saved"
+                }
+            },
+            "required": ["mapping_file_path", "workbook_file_path", "output_file_path"]
+        }
+    ),
+    Tool(
+        name="extract_toml_mappings",
+        description="""Analyzes a TOML configuration file to extract dimension mappings and create a CSV file.
 
-@app.list_prompts()
-async def list_prompts() -> list:
-    """List available prompts for Tableau dimension mapper."""
-    return [
-        {
-            "name": "remap_dimensions_from_toml",
-            "description": "Remap dimensions in a Tableau workbook using a TOML configuration file",
-            "arguments": [
-                {
-                    "name": "Workbook File Path",
-                    "description": "Path to the Tableau workbook file (.twb) to modify",
-                    "required": True
+        Look for a section in the TOML that contains field/dimension mappings, such as [columns.other_renames].
+        For each mapping found, extract the original name (key) and the new name (value).
+
+        Create a CSV string where each line is in the format: original_name,new_name
+        For example, if you find:
+        dimension_1 = "Distribution/Program"
+
+        The CSV line should be:
+        dimension_1,Distribution/Program
+
+        Do not include any headers in the CSV.
+        Strip any unnecessary quotes from the values.
+        Ensure there is no trailing comma or whitespace.
+        """,
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "toml_file_path": {
+                    "type": "string",
+                    "description": "Path to the TOML configuration file to analyze"
                 },
-                {
-                    "name": "Remapping TOML Path",
-                    "description": "Path to the TOML file containing dimension mappings",
-                    "required": True
+                "output_csv_path": {
+                    "type": "string",
+                    "description": "Path where the CSV mapping file should be saved"
+                }
+            },
+            "required": ["toml_file_path", "output_csv_path"]
+        }
+    ),
+    Tool(
+        name="validate_mapping_file",
+        description="""Validates a CSV mapping file to ensure it has the correct format.
+        The CSV should have two columns: the first column is the original field name, the second column is the new field name.
+        This tool will check if the file is properly formatted and return a list of the mappings it contains.
+
+        Example of a valid mapping CSV:
+        First name, name First
+        Last name, name Last
+        """,
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "mapping_file_path": {
+                    "type": "string",
+                    "description": "Path to the CSV mapping file to validate"
+                }
+            },
+            "required": ["mapping_file_path"]
+        }
+    ),
+    Tool(
+        name="validate_tableau_workbook",
+        description="""Validates a Tableau workbook file (.twb) to ensure it can be processed.
+        This tool checks if the file is a valid XML file with the expected Tableau workbook structure.
+        It returns information about the workbook such as version, number of datasources, and worksheets.
+        """,
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "workbook_file_path": {
+                    "type": "string",
+                    "description": "Path to the Tableau workbook file (.twb) to validate"
+                }
+            },
+            "required": ["workbook_file_path"]
+        }
+    ),
+    Tool(
+        name="analyze_workbook",
+        description="""Analyzes a Tableau workbook to identify dimensions and fields that could be remapped.
+        This tool parses the workbook XML structure and extracts field names, dimension references, and other metadata.
+        It provides a report of the fields found, their usage patterns, and potential candidates for remapping.
+        Use this tool to understand the structure of a workbook before creating mapping suggestions.
+        """,
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "workbook_file_path": {
+                    "type": "string",
+                    "description": "Path to the Tableau workbook file (.twb) to analyze"
+                }
+            },
+            "required": ["workbook_file_path"]
+        }
+    ),
+    Tool(
+        name="write_file",
+        description="""Writes content to a file at the specified path.
+        This tool is useful for creating CSV mapping files based on your analysis of a Tableau workbook.
+        You can use this after analyzing a workbook to create a mapping file with suggested dimension name improvements.
+        """,
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "file_path": {
+                    "type": "string",
+                    "description": "Path where the file should be written"
                 },
-                {
-                    "name": "Output File Path",
-                    "description": "Optional path where the modified workbook should be saved. If not provided, a default path will be generated.",
-                    "required": False
+                "content": {
+                    "type": "string",
+                    "description": "Content to write to the file"
                 }
-            ]
+            },
+            "required": ["file_path", "content"]
         }
-    ]
+    )
+]
 
-@app.list_resources()
-async def list_resources() -> list[Resource]:
-    """List available resources for Tableau dimension mapper.
-    
-    This server doesn't provide any resources directly, so we return an empty list.
-    """
-    return []
+@app.list_tools()
+async def list_tools() -> list[Tool]:
+    """List available Tableau dimension mapping tools."""
+    return _TOOLS
 
-@app.get_prompt()
-async def get_prompt(name: str, arguments: Any) -> dict:
-    """Get a prompt to send to the LLM."""
-    if name == "remap_dimensions_from_toml":
-        # Generate a default output path if not provided
-        output_file_path = arguments.get("Output File Path", "")
-        if not output_file_path:
-            workbook_path = arguments["Workbook File Path"]
-            base_name = os.path.basename(workbook_path)
-            name_without_ext = os.path.splitext(base_name)[0]
-            output_dir = os.path.dirname(workbook_path)
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            output_file_path = os.path.join(output_dir, f"{name_without_ext}_remapped_{timestamp}.twb")
-            
-        prompt_text = f"""
+# Prompts offered to the client, built once at import
+_PROMPTS: list = [
+    {
+        "name": "remap_dimensions_from_toml",
+        "description": "Remap dimensions in a Tableau workbook using a TOML configuration file",
+        "arguments": [
+            {
+                "name": "Workbook File Path",
+                "description": "Path to the Tableau workbook file (.twb) to modify",
+                "required": True
+            },
+            {
+                "name": "Remapping TOML Path",
+                "description": "Path to the TOML file containing dimension mappings",
+                "required": True
+            },
+            {
+                "name": "Output File Path",
+                "description": "Optional path where the modified workbook should be saved. If not provided, a default path will be generated.",
+                "required": False
+            }
+        ]
+    }
+]
+
+# Prompt text for remap_dimensions_from_toml; only the three file paths vary per call
+_REMAP_PROMPT_TPL = """
 You are a Tableau expert tasked with remapping dimensions in a Tableau workbook using a TOML configuration file.
 
 The user has provided:
-- A Tableau workbook file: {arguments["Workbook File Path"]}
-- A TOML configuration file: {arguments["Remapping TOML Path"]}
+- A Tableau workbook file: {workbook}
+- A TOML configuration file: {toml}
 
 Follow these steps to complete the remapping:
 
@@ -237,7 +500,7 @@ Follow these steps to complete the remapping:
 5. Validate the mapping file using the 'validate_mapping_file' tool to ensure it's properly formatted.
 
 6. Finally, use the 'remap_dimensions' tool to apply the mappings to the workbook and save the result to:
-   {output_file_path}
+   {output}
 
 7. Provide a summary of the changes made, including:
    - How many mappings were applied
@@ -246,6 +509,41 @@ Follow these steps to complete the remapping:
 
 Use the tools provided to accomplish this task step by step.
 """
+
+@app.list_prompts()
+async def list_prompts() -> list:
+    """List available prompts for Tableau dimension mapper."""
+    return _PROMPTS
+
+_RESOURCES: list[Resource] = []
+
+@app.list_resources()
+async def list_resources() -> list[Resource]:
+    """List available resources for Tableau dimension mapper.
+    
+    This server doesn't provide any resources directly, so we return an empty list.
+    """
+    return _RESOURCES
+
+@app.get_prompt()
+async def get_prompt(name: str, arguments: Any) -> dict:
+    """Get a prompt to send to the LLM."""
+    if name == "remap_dimensions_from_toml":
+        # Generate a default output path if not provided
+        output_file_path = arguments.get("Output File Path", "")
+        if not output_file_path:
+            workbook_path = arguments["Workbook File Path"]
+            base_name = os.path.basename(workbook_path)
+            name_without_ext = os.path.splitext(base_name)[0]
+            output_dir = os.path.dirname(workbook_path)
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            output_file_path = os.path.join(output_dir, f"{name_without_ext}_remapped_{timestamp}.twb")
+            
+        prompt_text = _REMAP_PROMPT_TPL.format_map({
+            'workbook': arguments["Workbook File Path"],
+            'toml': arguments["Remapping TOML Path"],
+            'output': output_file_path,
+        })
         # Return in the format expected by MCP
         return {
             "messages": [
@@ -261,323 +559,281 @@ Use the tools provided to accomplish this task step by step.
     
     raise ValueError(f"Unknown prompt: {name}")
 
-@app.call_tool()
-async def call_tool(name: str, arguments: Any) -> Sequence[TextContent | ImageContent | EmbeddedResource]:
-    """Handle tool calls for Tableau dimension mapping."""
+def _extract_toml_mappings(arguments: Any) -> str:
+    """Return the contents of a TOML file so the LLM can extract mappings from it."""
+    # Validate required arguments
+    required_args = ["toml_file_path", "output_csv_path"]
+    if not all(arg in arguments for arg in required_args):
+        raise ValueError(f"Missing required arguments. Need: {required_args}")
     
-    if name == "extract_toml_mappings":
-        # Validate required arguments
-        required_args = ["toml_file_path", "output_csv_path"]
-        if not all(arg in arguments for arg in required_args):
-            raise ValueError(f"Missing required arguments. Need: {required_args}")
-            
+    try:
+        # Just read and return the file contents, decoding the raw bytes once
+        with open(arguments["toml_file_path"], 'rb') as f:
+            data = f.read()
+        return data.decode('utf-8')
+    
+    except Exception as e:
+        return f"Error reading TOML file: {str(e)}"
+
+def _validate_mapping_file(arguments: Any) -> str:
+    """Check that a CSV mapping file is well formed and list its mappings."""
+    # Validate required arguments
+    if "mapping_file_path" not in arguments:
+        raise ValueError("Missing required argument: mapping_file_path")
+    
+    mapping_file_path = arguments["mapping_file_path"]
+    
+    # Check file extension
+    if not mapping_file_path.lower().endswith('.csv'):
+        return f"Error: File must be a CSV file. Got {mapping_file_path}"
+    
+    try:
+        # Read the mapping file
         try:
-            # Just read and return the file contents
-            with open(arguments["toml_file_path"], 'r') as f:
-                return [TextContent(
-                    type="text",
-                    text=f.read()
-                )]
-                
-        except Exception as e:
-            return [TextContent(
-                type="text",
-                text=f"Error reading TOML file: {str(e)}"
-            )]
-    
-    elif name == "validate_mapping_file":
-        # Validate required arguments
-        if "mapping_file_path" not in arguments:
-            raise ValueError("Missing required argument: mapping_file_path")
+            mappings = _load_mappings(mapping_file_path, strict=True)
+        except ValueError as e:
+            return f"Error: {str(e)}"
         
-        mapping_file_path = arguments["mapping_file_path"]
+        if not mappings:
+            return "Error: Mapping file is empty"
         
-        # Check file extension
-        if not mapping_file_path.lower().endswith('.csv'):
-            return [TextContent(
-                type="text",
-                text=f"Error: File must be a CSV file. Got {mapping_file_path}"
-            )]
+        # Format the mappings for display
+        formatted_mappings = "\n".join([f"• \"{old}\" → \"{new}\"" for old, new in mappings])
         
-        try:
-            # Read the mapping file
-            mappings = []
-            with open(mapping_file_path, 'r') as f:
-                reader = csv.reader(f)
-                for i, row in enumerate(reader):
-                    if len(row) < 2:
-                        return [TextContent(
-                            type="text",
-                            text=f"Error: Line {i+1} does not have at least two columns"
-                        )]
-                    mappings.append((row[0].strip(), row[1].strip()))
-            
-            if not mappings:
-                return [TextContent(
-                    type="text",
-                    text="Error: Mapping file is empty"
-                )]
-            
-            # Format the mappings for display
-            formatted_mappings = "\n".join([f"• \"{old}\" → \"{new}\"" for old, new in mappings])
-            
-            return [TextContent(
-                type="text",
-                text=f"✅ Mapping file is valid with {len(mappings)} mappings:\n\n{formatted_mappings}"
-            )]
-            
-        except Exception as e:
-            return [TextContent(
-                type="text",
-                text=f"Error validating mapping file: {str(e)}"
-            )]
-            
-    elif name == "validate_tableau_workbook":
-        # Validate required arguments
-        if "workbook_file_path" not in arguments:
-            raise ValueError("Missing required argument: workbook_file_path")
+        return f"✅ Mapping file is valid with {len(mappings)} mappings:\n\n{formatted_mappings}"
+    
+    except Exception as e:
+        return f"Error validating mapping file: {str(e)}"
+
+def _validate_tableau_workbook(arguments: Any) -> str:
+    """Check that a file is a Tableau workbook and summarise its structure."""
+    # Validate required arguments
+    if "workbook_file_path" not in arguments:
+        raise ValueError("Missing required argument: workbook_file_path")
+    
+    workbook_file_path = arguments["workbook_file_path"]
+    
+    # Check file extension
+    if not workbook_file_path.lower().endswith('.twb'):
+        return f"Error: File must be a Tableau workbook (.twb) file. Got {workbook_file_path}"
+    
+    try:
+        workbook = _load_workbook(workbook_file_path)
         
-        workbook_file_path = arguments["workbook_file_path"]
+        # Check if it's a tableau workbook
+        if not workbook['is_workbook']:
+            return "Error: File does not appear to be a valid Tableau workbook"
         
-        # Check file extension
-        if not workbook_file_path.lower().endswith('.twb'):
-            return [TextContent(
-                type="text",
-                text=f"Error: File must be a Tableau workbook (.twb) file. Got {workbook_file_path}"
-            )]
+        return f"✅ Tableau workbook is valid (version {workbook['version']}) with {workbook['datasources']} datasources and {workbook['worksheet_count']} worksheets"
+    
+    except SyntaxError as e:
+        # Both ElementTree.ParseError and lxml's XMLSyntaxError derive from SyntaxError
+        return f"Error: File is not valid XML: {str(e)}"
+    except Exception as e:
+        return f"Error validating Tableau workbook: {str(e)}"
+
+def _remap_dimensions(arguments: Any) -> str:
+    """Apply a CSV mapping file to a Tableau workbook and report the replacements made."""
+    # Validate required arguments
+    required_args = ["mapping_file_path", "workbook_file_path", "output_file_path"]
+    if not all(arg in arguments for arg in required_args):
+        raise ValueError(f"Missing required arguments. Need: {required_args}")
+    
+    mapping_file_path = arguments["mapping_file_path"]
+    workbook_file_path = arguments["workbook_file_path"]
+    output_file_path = arguments["output_file_path"]
+    
+    try:
+        # Read the mapping file
+        mappings = _load_mappings(mapping_file_path)
+        
+        if not mappings:
+            return "Error: Mapping file is empty"
         
+        _ensure_dir(output_file_path)
+        # Write next to the output and move it into place only on success, so an in-place
+        # remap still reads the original workbook and a failure leaves no partial file
+        fout = tempfile.NamedTemporaryFile(dir=os.path.dirname(output_file_path) or '.', delete=False)
         try:
-            # Read the tableau file and check if it's valid XML
-            with open(workbook_file_path, 'r') as f:
-                content = f.read()
-                soup = BeautifulSoup(content, 'lxml-xml')
-                
-                # Check if it's a tableau workbook
-                if soup.workbook is None:
-                    return [TextContent(
-                        type="text",
-                        text="Error: File does not appear to be a valid Tableau workbook"
-                    )]
-                
-                # Get some basic information about the workbook
-                workbook_version = soup.workbook.get('version', 'unknown')
-                datasources = len(soup.find_all('datasource'))
-                worksheets = len(soup.find_all('worksheet'))
-                
-                return [TextContent(
-                    type="text",
-                    text=f"✅ Tableau workbook is valid (version {workbook_version}) with {datasources} datasources and {worksheets} worksheets"
-                )]
-                
-        except Exception as e:
-            return [TextContent(
-                type="text",
-                text=f"Error validating Tableau workbook: {str(e)}"
-            )]
-            
-    elif name == "remap_dimensions":
-        # Validate required arguments
-        required_args = ["mapping_file_path", "workbook_file_path", "output_file_path"]
-        if not all(arg in arguments for arg in required_args):
-            raise ValueError(f"Missing required arguments. Need: {required_args}")
+            with fout, open(workbook_file_path, 'rb') as fin:
+                if len(mappings) == 1:
+                    # A single rule needs no matcher; split and join it chunk by chunk
+                    old, new = mappings[0]
+                    replacements_by_mapping = _stream_split_replace(fin, fout, old, new)
+                elif os.fstat(fin.fileno()).st_size == 0:
+                    # Empty files cannot be memory-mapped and have nothing to replace
+                    replacements_by_mapping = {}
+                else:
+                    with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        if len(mappings) <= _REGEX_MAX_RULES:
+                            # The regex scans the memory-mapped workbook in place, so no chunking is needed
+                            find_matches = _build_regex_matcher(mappings)
+                            replacements_by_mapping = _replace_mapped(mm, fout, find_matches)
+                        else:
+                            # The automaton scans a decoded copy of its input, so read the mapping a chunk at a time
+                            find_matches = _build_automaton_matcher(mappings)
+                            max_len = max(len(old.encode('utf-8')) for old, _ in mappings)
+                            replacements_by_mapping = _stream_replace(mm, fout, find_matches, max_len)
+            shutil.copymode(workbook_file_path, fout.name)
+            os.replace(fout.name, output_file_path)
+        except BaseException:
+            os.unlink(fout.name)
+            raise
+        replacements_made = sum(replacements_by_mapping.values())
         
-        mapping_file_path = arguments["mapping_file_path"]
-        workbook_file_path = arguments["workbook_file_path"]
-        output_file_path = arguments["output_file_path"]
+        # Format the replacements for display
+        replacements_details = [
+            f"• \"{old}\" → \"{new}\": {replacements_by_mapping.get(old, 0)} replacements"
+            for old, new in mappings
+        ]
         
-        try:
-            # Read the mapping file
-            mappings = []
-            with open(mapping_file_path, 'r') as f:
-                reader = csv.reader(f)
-                for row in reader:
-                    if len(row) >= 2:
-                        mappings.append((row[0].strip(), row[1].strip()))
-            
-            if not mappings:
-                return [TextContent(
-                    type="text",
-                    text="Error: Mapping file is empty"
-                )]
-            
-            # Read the tableau file
-            with open(workbook_file_path, 'r') as f:
-                tableau_content = f.read()
-            
-            # Apply replacements
-            modified_content = tableau_content
-            replacements_made = 0
-            replacements_by_mapping = {}
-            
-            for old, new in mappings:
-                occurrences = modified_content.count(old)
-                if occurrences > 0:
-                    modified_content = modified_content.replace(old, new)
-                    replacements_made += occurrences
-                    replacements_by_mapping[old] = occurrences
-            
-            # Write the modified content to the output file
-            os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
-            with open(output_file_path, 'w') as f:
-                f.write(modified_content)
-            
-            # Format the replacements for display
-            replacements_details = []
-            for old, new in mappings:
-                count = replacements_by_mapping.get(old, 0)
-                replacements_details.append(f"• \"{old}\" → \"{new}\": {count} replacements")
-            
-            formatted_replacements = "\n".join(replacements_details)
-            
-            # Use LLM to explain the changes (in a real implementation)
-            # Here we just provide a simple explanation based on the data
-            explanation = "The dimension remapping has been applied successfully. "
-            
-            if replacements_made > 0:
-                explanation += f"A total of {replacements_made} replacements were made across {len(replacements_by_mapping)} different mappings. "
-                explanation += "These changes may affect calculated fields, visualizations, and filters that reference the renamed dimensions. "
-                explanation += "Make sure to validate the workbook after opening it in Tableau."
-            else:
-                explanation += "No replacements were made. This could indicate that the mapping file contains dimension names that don't exist in the workbook."
-            
-            return [TextContent(
-                type="text",
-                text=f"✅ Successfully remapped dimensions in the Tableau workbook.\n\n"
-                     f"Made {replacements_made} replacements using {len(mappings)} mapping rules.\n\n"
-                     f"Replacement details:\n{formatted_replacements}\n\n"
-                     f"Analysis of Changes:\n{explanation}\n\n"
-                     f"Modified workbook saved to: {output_file_path}"
-            )]
-            
-        except Exception as e:
-            return [TextContent(
-                type="text",
-                text=f"Error remapping dimensions: {str(e)}"
-            )]
-            
-    elif name == "analyze_workbook":
-        # Validate required arguments
-        if "workbook_file_path" not in arguments:
-            raise ValueError("Missing required argument: workbook_file_path")
+        # Use LLM to explain the changes (in a real implementation)
+        # Here we just provide a simple explanation based on the data
+        explanation = (
+            "The dimension remapping has been applied successfully. "
+            f"A total of {replacements_made} replacements were made across {len(replacements_by_mapping)} different mappings. "
+            "These changes may affect calculated fields, visualizations, and filters that reference the renamed dimensions. "
+            "Make sure to validate the workbook after opening it in Tableau."
+            if replacements_made > 0 else
+            "The dimension remapping has been applied successfully. "
+            "No replacements were made. This could indicate that the mapping file contains dimension names that don't exist in the workbook."
+        )
         
-        workbook_file_path = arguments["workbook_file_path"]
+        return "\n".join([
+            "✅ Successfully remapped dimensions in the Tableau workbook.",
+            "",
+            f"Made {replacements_made} replacements using {len(mappings)} mapping rules.",
+            "",
+            "Replacement details:",
+            *replacements_details,
+            "",
+            "Analysis of Changes:",
+            explanation,
+            "",
+            f"Modified workbook saved to: {output_file_path}",
+        ])
+    
+    except Exception as e:
+        return f"Error remapping dimensions: {str(e)}"
+
+def _analyze_workbook(arguments: Any) -> str:
+    """Report the fields, worksheets and naming patterns found in a Tableau workbook."""
+    # Validate required arguments
+    if "workbook_file_path" not in arguments:
+        raise ValueError("Missing required argument: workbook_file_path")
+    
+    workbook_file_path = arguments["workbook_file_path"]
+    
+    try:
+        # Reuse the parsed workbook if it was already validated or analyzed
+        workbook = _load_workbook(workbook_file_path)
+        columns = workbook['columns']
+        worksheets = workbook['worksheets']
         
-        try:
-            # Read the tableau file
-            with open(workbook_file_path, 'r') as f:
-                tableau_content = f.read()
-                soup = BeautifulSoup(tableau_content, 'lxml-xml')
-            
-            # Extract column names and metadata
-            columns = []
-            for column in soup.find_all('column'):
-                name = column.get('name', '')
-                if name and name not in columns:
-                    columns.append(name)
-            
-            # Extract fields from calculated fields
-            calculated_fields = []
-            for calculation in soup.find_all('calculation'):
-                formula = calculation.get('formula', '')
-                if formula:
-                    calculated_fields.append(formula)
-            
-            # Extract worksheet names
-            worksheets = []
-            for worksheet in soup.find_all('worksheet'):
-                name = worksheet.get('name', '')
-                if name:
-                    worksheets.append(name)
-            
-            # Format the analysis for display
-            analysis = f"# Tableau Workbook Analysis\n\n"
-            analysis += f"## Overview\n"
-            analysis += f"- **File:** {os.path.basename(workbook_file_path)}\n"
-            analysis += f"- **Version:** {soup.workbook.get('version', 'unknown')}\n"
-            analysis += f"- **Worksheets:** {len(worksheets)}\n"
-            analysis += f"- **Fields:** {len(columns)}\n\n"
-            
-            analysis += f"## Fields Found\n"
-            if columns:
-                analysis += "The following fields were found in the workbook:\n\n"
-                for column in sorted(columns):
-                    analysis += f"- `{column}`\n"
-            else:
-                analysis += "No fields were found in the workbook.\n"
-            
-            analysis += f"\n## Worksheets\n"
-            if worksheets:
-                for worksheet in sorted(worksheets):
-                    analysis += f"- {worksheet}\n"
-            else:
-                analysis += "No worksheets were found in the workbook.\n"
-            
-            analysis += f"\n## Potential Naming Patterns\n"
-            
-            # Simple pattern detection
-            prefixed_fields = {}
-            for column in columns:
-                parts = column.split()
-                if len(parts) > 1:
-                    prefix = parts[0]
-                    if prefix in prefixed_fields:
-                        prefixed_fields[prefix].append(column)
-                    else:
-                        prefixed_fields[prefix] = [column]
-            
-            # Display potential patterns
-            if prefixed_fields:
-                analysis += "The following potential naming patterns were detected:\n\n"
-                for prefix, fields in prefixed_fields.items():
-                    if len(fields) > 1:
-                        analysis += f"### Fields with prefix '{prefix}':\n"
-                        for field in fields:
-                            analysis += f"- `{field}`\n"
-                        analysis += "\n"
-            else:
-                analysis += "No clear naming patterns were detected.\n"
-            
-            return [TextContent(
-                type="text",
-                text=analysis
-            )]
-            
-        except Exception as e:
-            return [TextContent(
-                type="text",
-                text=f"Error analyzing workbook: {str(e)}"
-            )]
-            
-    elif name == "write_file":
-        # Validate required arguments
-        required_args = ["file_path", "content"]
-        if not all(arg in arguments for arg in required_args):
-            raise ValueError(f"Missing required arguments. Need: {required_args}")
+        # Format the analysis for display
+        parts = [
+            "# Tableau Workbook Analysis",
+            "",
+            "## Overview",
+            f"- **File:** {os.path.basename(workbook_file_path)}",
+            f"- **Version:** {workbook['version']}",
+            f"- **Worksheets:** {len(worksheets)}",
+            f"- **Fields:** {len(columns)}",
+            "",
+            "## Fields Found",
+        ]
+        if columns:
+            parts.append("The following fields were found in the workbook:")
+            parts.append("")
+            parts.extend(f"- `{column}`" for column in columns)
+        else:
+            parts.append("No fields were found in the workbook.")
         
-        file_path = arguments["file_path"]
-        content = arguments["content"]
+        parts.append("")
+        parts.append("## Worksheets")
+        if worksheets:
+            parts.extend(f"- {worksheet}" for worksheet in sorted(worksheets))
+        else:
+            parts.append("No worksheets were found in the workbook.")
         
-        try:
-            # Create directory if it doesn't exist
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            
-            # Write content to file
-            with open(file_path, 'w') as f:
-                f.write(content)
-            
-            return [TextContent(
-                type="text",
-                text=f"✅ Successfully wrote content to file: {file_path}"
-            )]
-            
-        except Exception as e:
-            return [TextContent(
-                type="text",
-                text=f"Error writing to file: {str(e)}"
-            )]
+        parts.append("")
+        parts.append("## Potential Naming Patterns")
+        
+        # Simple pattern detection: group fields by their first word
+        prefixed_fields = defaultdict(list)
+        for column in columns:
+            space = column.find(' ')
+            if space > 0:
+                prefixed_fields[column[:space]].append(column)
+        patterns = [(prefix, fields) for prefix, fields in prefixed_fields.items() if len(fields) > 1]
+        
+        # Display potential patterns
+        if patterns:
+            parts.append("The following potential naming patterns were detected:")
+            parts.append("")
+            for prefix, fields in patterns:
+                parts.append(f"### Fields with prefix '{prefix}':")
+                parts.extend(f"- `{field}`" for field in fields)
+                parts.append("")
+        else:
+            parts.append("No clear naming patterns were detected.")
+        parts.append("")
+        
+        return "\n".join(parts)
     
-    else:
+    except Exception as e:
+        return f"Error analyzing workbook: {str(e)}"
+
+def _write_file(arguments: Any) -> str:
+    """Write text content to a file, creating its directory if needed."""
+    # Validate required arguments
+    required_args = ["file_path", "content"]
+    if not all(arg in arguments for arg in required_args):
+        raise ValueError(f"Missing required arguments. Need: {required_args}")
+    
+    file_path = arguments["file_path"]
+    content = arguments["content"]
+    
+    try:
+        # Create directory if it doesn't exist
+        _ensure_dir(file_path)
+        
+        # Write content to file, encoding one chunk at a time
+        with open(file_path, 'wb') as f:
+            for i in range(0, len(content), _CHUNK_SIZE):
+                f.write(content[i:i + _CHUNK_SIZE].encode('utf-8'))
+        
+        return f"✅ Successfully wrote content to file: {file_path}"
+    
+    except Exception as e:
+        return f"Error writing to file: {str(e)}"
+
+# Synchronous tool implementations; call_tool runs them in worker threads
+_TOOL_HANDLERS = {
+    "extract_toml_mappings": _extract_toml_mappings,
+    "validate_mapping_file": _validate_mapping_file,
+    "validate_tableau_workbook": _validate_tableau_workbook,
+    "remap_dimensions": _remap_dimensions,
+    "analyze_workbook": _analyze_workbook,
+    "write_file": _write_file,
+}
+
+@app.call_tool()
+async def call_tool(name: str, arguments: Any) -> Sequence[TextContent | ImageContent | EmbeddedResource]:
+    """Handle tool calls for Tableau dimension mapping.
+    
+    The tools do blocking file I/O and parsing, so each call runs in a worker thread
+    to keep the event loop free for concurrent requests.
+    """
+    handler = _TOOL_HANDLERS.get(name)
+    if handler is None:
         raise ValueError(f"Unknown tool: {name}")
+    
+    text = await asyncio.to_thread(handler, arguments)
+    return [TextContent(
+        type="text",
+        text=text
+    )]
 
 async def main():
     from mcp.server.stdio import stdio_server
@@ -0,0 +1,168 @@
+import io
+import os
+
+import pytest
+
+from tableau_dimension_mapper import server
+
+WORKBOOK = (
+    "<?xml version='1.0' encoding='utf-8' ?>\n"
+    "<workbook version='18.1'><datasources><datasource name='ds'>"
+    "<column name='[First name]' /><column name='[Last name]' />"
+    "</datasource></datasources></workbook>"
+)
+
+
+def _remap(tmp_path, mapping_csv, workbook_path, output_path):
+    mapping_path = tmp_path / "mapping.csv"
+    mapping_path.write_text(mapping_csv)
+    return server._remap_dimensions({
+        "mapping_file_path": str(mapping_path),
+        "workbook_file_path": str(workbook_path),
+        "output_file_path": str(output_path),
+    })
+
+
+@pytest.mark.parametrize("mapping_csv, regex_max_rules", [
+    ("First name,Given name\n", server._REGEX_MAX_RULES),
+    ("First name,Given name\nLast name,Family name\n", server._REGEX_MAX_RULES),
+    ("First name,Given name\nLast name,Family name\n", 1),
+])
+def test_remap_in_place(tmp_path, monkeypatch, mapping_csv, regex_max_rules):
+    monkeypatch.setattr(server, "_REGEX_MAX_RULES", regex_max_rules)
+    workbook_path = tmp_path / "book.twb"
+    workbook_path.write_text(WORKBOOK)
+
+    result = _remap(tmp_path, mapping_csv, workbook_path, workbook_path)
+
+    assert result.startswith("✅")
+    content = workbook_path.read_text()
+    assert "[Given name]" in content
+    assert "[First name]" not in content
+    assert sorted(os.listdir(tmp_path)) == ["book.twb", "mapping.csv"]
+
+
+def test_remap_failure_leaves_no_output(tmp_path):
+    output_path = tmp_path / "out.twb"
+
+    result = _remap(tmp_path, "First name,Given name\n", tmp_path / "missing.twb", output_path)
+
+    assert result.startswith("Error remapping dimensions")
+    assert sorted(os.listdir(tmp_path)) == ["mapping.csv"]
+
+
+def _write_mappings(tmp_path, content):
+    mapping_path = tmp_path / "mapping.csv"
+    mapping_path.write_bytes(content.encode("utf-8"))
+    return str(mapping_path)
+
+
+def test_quoted_mappings_after_single_field_first_line(tmp_path):
+    mapping_path = _write_mappings(tmp_path, '"header"\n"a","b"\n"c","d"\n')
+
+    assert server._load_mappings(mapping_path) == [("a", "b"), ("c", "d")]
+
+
+def test_quoted_mappings_report_file_line_numbers(tmp_path):
+    mapping_path = _write_mappings(tmp_path, '"a","b"\n\n"c"\n')
+
+    with pytest.raises(ValueError, match="Line 3"):
+        server._load_mappings(mapping_path, strict=True)
+
+
+def test_empty_new_name_is_a_deletion_rule(tmp_path):
+    mapping_path = _write_mappings(tmp_path, "Sales,\n,Orphan\n")
+
+    assert server._load_mappings(mapping_path) == [("Sales", "")]
+    with pytest.raises(ValueError, match="Line 2 has an empty original name"):
+        server._load_mappings(mapping_path, strict=True)
+
+
+@pytest.mark.parametrize("regex_max_rules", [server._REGEX_MAX_RULES, 1])
+def test_first_rule_wins_for_repeated_names(tmp_path, monkeypatch, regex_max_rules):
+    monkeypatch.setattr(server, "_REGEX_MAX_RULES", regex_max_rules)
+    workbook_path = tmp_path / "book.twb"
+    workbook_path.write_text("<workbook><column name='[Sales]' /></workbook>")
+    output_path = tmp_path / "out.twb"
+
+    _remap(tmp_path, "Sales,Revenue\nSales,Turnover\n", workbook_path, output_path)
+
+    assert "[Revenue]" in output_path.read_text()
+
+
+@pytest.mark.parametrize("build_matcher", [server._build_regex_matcher, server._build_automaton_matcher])
+@pytest.mark.parametrize("chunk_size", range(1, 13))
+def test_stream_replace_across_chunk_boundaries(monkeypatch, build_matcher, chunk_size):
+    monkeypatch.setattr(server, "_CHUNK_SIZE", chunk_size)
+    mappings = [("First", "Primary"), ("First name", "Given name"), ("Prénom", "Name")]
+    workbook = "<c name='First name'/><c name='First'/><c name='Prénom'/>".encode("utf-8")
+    max_len = max(len(old.encode("utf-8")) for old, _ in mappings)
+    fout = io.BytesIO()
+
+    counts = server._stream_replace(io.BytesIO(workbook), fout, build_matcher(mappings), max_len)
+
+    assert fout.getvalue() == b"<c name='Given name'/><c name='Primary'/><c name='Name'/>"
+    assert counts == {"First name": 1, "First": 1, "Prénom": 1}
+
+
+@pytest.mark.parametrize("chunk_size", range(1, 7))
+@pytest.mark.parametrize(
+    "workbook, expected, count",
+    [(b"aaaa", b"bb", 2), (b"xaaaaay", b"xbbay", 2), (b"aaxaa", b"bxb", 2), (b"xax", b"xax", 0)],
+)
+def test_stream_split_replace_across_chunk_boundaries(monkeypatch, chunk_size, workbook, expected, count):
+    monkeypatch.setattr(server, "_CHUNK_SIZE", chunk_size)
+    fout = io.BytesIO()
+
+    counts = server._stream_split_replace(io.BytesIO(workbook), fout, "aa", "b")
+
+    assert fout.getvalue() == expected
+    assert counts == ({"aa": count} if count else {})
+
+
+@pytest.fixture
+def parsed_paths(monkeypatch):
+    monkeypatch.setattr(server, "_WORKBOOK_CACHE", {})
+    parsed = []
+    parse_workbook = server._parse_workbook
+
+    def counting_parse_workbook(workbook_file_path, size):
+        parsed.append(os.path.basename(workbook_file_path))
+        return parse_workbook(workbook_file_path, size)
+
+    monkeypatch.setattr(server, "_parse_workbook", counting_parse_workbook)
+    return parsed
+
+
+def test_rewritten_workbook_is_parsed_again(tmp_path, parsed_paths):
+    workbook_path = tmp_path / "book.twb"
+    workbook_path.write_text(WORKBOOK)
+    assert server._load_workbook(str(workbook_path))["columns"] == ("[First name]", "[Last name]")
+    server._load_workbook(str(workbook_path))
+    assert parsed_paths == ["book.twb"]
+
+    workbook_path.write_text(WORKBOOK.replace("[Last name]", "[Surname]"))
+    assert server._load_workbook(str(workbook_path))["columns"] == ("[First name]", "[Surname]")
+    assert parsed_paths == ["book.twb", "book.twb"]
+
+    stat = workbook_path.stat()
+    os.utime(workbook_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    server._load_workbook(str(workbook_path))
+    assert parsed_paths == ["book.twb", "book.twb", "book.twb"]
+
+
+def test_workbook_cache_evicts_least_recently_used(tmp_path, parsed_paths):
+    names = ["a.twb", "b.twb", "c.twb", "d.twb", "e.twb"]
+    for name in names:
+        (tmp_path / name).write_text(WORKBOOK)
+    for name in names[:4]:
+        server._load_workbook(str(tmp_path / name))
+    server._load_workbook(str(tmp_path / "a.twb"))
+    server._load_workbook(str(tmp_path / "e.twb"))
+    assert parsed_paths == names
+
+    cached = {os.path.basename(key[0]) for key in server._WORKBOOK_CACHE}
+    assert cached == {"a.twb", "c.twb", "d.twb", "e.twb"}
+    server._load_workbook(str(tmp_path / "a.twb"))
+    server._load_workbook(str(tmp_path / "b.twb"))
+    assert parsed_paths == names + ["b.twb"]